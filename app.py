@@ -11,86 +11,358 @@ import pickle
 from datetime import datetime
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from face_utils import FaceUtils
 from attendance_manager import AttendanceManager
 
+# Optional libjpeg-turbo encoder (SIMD Huffman/DCT kernels) for the MJPEG stream
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
 app = Flask(__name__)
 
+# Static MJPEG part header, built once instead of per frame
+_FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+class CameraWorker(threading.Thread):
+    """Capture thread that keeps only the newest decoded frame (1-slot LIFO buffer)"""
+
+    def __init__(self, camera, skip_every):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.skip_every = skip_every
+        self.latest_frame = None
+        self.seq = 0  # bumped per decoded frame so consumers can wait for a new one
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Continuously grab frames, decoding only every Nth into the buffer slot"""
+        grab_count = 0
+        while not self.stopped.is_set():
+            # Yield point: under the gevent worker this thread is a greenlet
+            # and grab()/retrieve() are C calls that never hit the event
+            # loop - without a patched sleep here the capture loop would
+            # monopolize the hub and starve every other request
+            time.sleep(0.001)
+
+            if not self.camera.grab():
+                break
+
+            grab_count += 1
+            if grab_count % self.skip_every != 0:
+                continue
+
+            success, frame = self.camera.retrieve()
+            if not success:
+                break
+
+            # Overwrite the single slot - consumers always see the newest frame
+            with self.new_frame:
+                self.latest_frame = frame
+                self.seq += 1
+                self.new_frame.notify_all()
+
+    def read(self):
+        """Return a copy of the newest frame, or None if nothing captured yet"""
+        with self.lock:
+            if self.latest_frame is None:
+                return None
+            return self.latest_frame.copy()
+
+    def read_new(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq exists, then return
+        (frame copy, its sequence number). Returns (None, last_seq) on
+        timeout or after stop(), so callers can check is_alive() and bail.
+        """
+        with self.new_frame:
+            self.new_frame.wait_for(
+                lambda: self.seq > last_seq or self.stopped.is_set(), timeout)
+            if self.seq > last_seq and self.latest_frame is not None:
+                return self.latest_frame.copy(), self.seq
+            return None, last_seq
+
+    def stop(self):
+        """Signal the capture loop to exit and wake any waiting consumers"""
+        self.stopped.set()
+        with self.new_frame:
+            self.new_frame.notify_all()
+
 class AttendanceSystem:
     def __init__(self):
         """Initialize the attendance system with required components"""
         self.face_utils = FaceUtils()
         self.attendance_manager = AttendanceManager()
         self.camera = None
+        self.camera_worker = None
         self.is_camera_active = False
         self.recognized_today = set()  # Track who has been marked present today
         self.last_recognition_time = {}  # Prevent rapid duplicate recognitions
+        self._tracks = []  # Recently recognized faces: {'box', 'name', 't_seen'}
+
+        # Recognition runs on this pool so a slow match never stalls the
+        # stream; results land back on the submitting track
+        self._recognize_pool = ThreadPoolExecutor(max_workers=2)
         
         # Ensure required directories exist
         os.makedirs('student_images', exist_ok=True)
         os.makedirs('attendance_records', exist_ok=True)
         os.makedirs('face_encodings', exist_ok=True)
+
+        # Load the Haar cascade once - reparsing the XML per frame costs tens of ms
+        cascade_path = os.path.join('data', 'haarcascade_frontalface_default.xml')
+        if not os.path.exists(cascade_path):
+            cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.face_cascade = cv2.CascadeClassifier(cascade_path)
+        if self.face_cascade.empty():
+            raise RuntimeError(f"Failed to load Haar cascade from {cascade_path}")
+
+        # Optional DNN face detector (ResNet-SSD, faster and more accurate than
+        # Haar). Used when the Caffe model files are dropped into data/;
+        # otherwise detection stays on the cascade.
+        self.face_net = None
+        prototxt = os.path.join('data', 'deploy.prototxt')
+        weights = os.path.join('data', 'res10_300x300_ssd_iter_140000.caffemodel')
+        if os.path.exists(prototxt) and os.path.exists(weights):
+            self.face_net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+            self.face_net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.face_net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            print("✅ Using DNN face detector (ResNet-SSD)")
+
+        # Offload per-frame resize/cvtColor/detection to the GPU via the
+        # OpenCL T-API when a device is available (UMat inputs dispatch
+        # transparently), freeing CPU for recognition and JPEG encode
+        cv2.ocl.setUseOpenCL(True)
+        self.use_opencl = cv2.ocl.useOpenCL()
+        if self.use_opencl:
+            print("✅ OpenCL enabled for frame preprocessing")
+
+        # JPEG encoder for streaming: TurboJPEG when installed, cv2.imencode otherwise
+        self.jpeg = None
+        if TurboJPEG is not None:
+            try:
+                self.jpeg = TurboJPEG()
+                print("✅ Using TurboJPEG encoder for streaming")
+            except Exception as e:
+                print(f"⚠️ TurboJPEG unavailable ({e}), falling back to cv2.imencode")
         
         # Load existing face encodings
         self.face_utils.load_encodings()
     
+    @staticmethod
+    def configure_camera(cam):
+        """Request MJPG at a fixed resolution so the sensor compresses on-device.
+
+        Uncompressed YUY2 over USB caps HD capture at 5-10 FPS; MJPG cuts the
+        USB payload ~10x and OpenCV decodes it with libjpeg-turbo.
+        """
+        cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        cam.set(cv2.CAP_PROP_FPS, 30)
+        # Keep the driver buffer shallow so grab() always sees a fresh frame
+        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
     def get_camera(self):
         """Initialize camera if not already active"""
         if self.camera is None:
             print("🔍 Scanning for available cameras...")
-            for index in range(5):  # check first 5 indexes
-                cam = cv2.VideoCapture(index, cv2.CAP_DSHOW)  # force DirectShow backend
+            # Index 0 is almost always the right camera - probe it across
+            # backends first (MSMF has the lowest latency on Windows 10+)
+            # instead of paying the 1-3 s failed-open timeout per index of
+            # a full sweep; higher indexes are only tried as a last resort
+            candidates = [(0, cv2.CAP_MSMF), (0, cv2.CAP_DSHOW), (0, cv2.CAP_ANY)]
+            candidates += [(index, cv2.CAP_ANY) for index in range(1, 5)]
+
+            for index, backend in candidates:
+                cam = cv2.VideoCapture(index, backend)
                 if cam.isOpened():
-                    print(f"✅ Camera opened successfully at index {index} (DirectShow)")
+                    print(f"✅ Camera opened successfully at index {index}")
+                    self.configure_camera(cam)
                     self.camera = cam
                     break
-                else:
-                    print(f"❌ Camera index {index} not available")
+                print(f"❌ Camera index {index} not available")
                 cam.release()
-            
+
             if self.camera is None:
                 raise Exception("Could not access any camera")
         return self.camera
 
+    def get_camera_worker(self):
+        """Start the capture thread if not already running"""
+        if self.camera_worker is None or not self.camera_worker.is_alive():
+            camera = self.get_camera()
+            self.camera_worker = CameraWorker(camera, self.SKIP_EVERY)
+            self.camera_worker.start()
+        return self.camera_worker
+
     def release_camera(self):
         """Release camera resources"""
+        if self.camera_worker is not None:
+            self.camera_worker.stop()
+            self.camera_worker.join(timeout=2)
+            self.camera_worker = None
         if self.camera is not None:
             self.camera.release()
             self.camera = None
         self.is_camera_active = False
     
+    # Decode only every Nth grabbed frame; grab() drains the driver buffer
+    # cheaply while retrieve() pays the full decode cost (~6 FPS at 30 FPS capture)
+    SKIP_EVERY = 5
+
+    # Run the detector only on every Kth decoded frame; between key frames
+    # the last detections are carried forward and the IoU tracks keep the
+    # names attached
+    DETECT_EVERY = 3
+
+    # A detection overlapping a track seen within TRACK_TTL seconds by more
+    # than TRACK_IOU reuses the track's name instead of re-running recognition
+    TRACK_TTL = 1.0
+    TRACK_PRUNE = 2.0
+    TRACK_IOU = 0.5
+
+    # Tracks still named "Unknown" retry recognition at this interval with a
+    # fresh crop - only positive matches are cached indefinitely, so one
+    # blurry first crop cannot pin a present student as Unknown
+    UNKNOWN_RETRY = 1.0
+
+    @staticmethod
+    def _iou(box_a, box_b):
+        """Intersection-over-union of two (top, right, bottom, left) boxes"""
+        top = max(box_a[0], box_b[0])
+        right = min(box_a[1], box_b[1])
+        bottom = min(box_a[2], box_b[2])
+        left = max(box_a[3], box_b[3])
+        if right <= left or bottom <= top:
+            return 0.0
+        intersection = (right - left) * (bottom - top)
+        area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+        area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+        return intersection / float(area_a + area_b - intersection)
+
+    def detect_faces(self, small_frame, gray_small_frame):
+        """Detect faces on the downscaled frame, returning (x, y, w, h) boxes"""
+        if self.face_net is not None:
+            if isinstance(small_frame, cv2.UMat):
+                small_frame = small_frame.get()
+            h, w = small_frame.shape[:2]
+            blob = cv2.dnn.blobFromImage(small_frame, 1.0, (300, 300), (104, 177, 123))
+            self.face_net.setInput(blob)
+            detections = self.face_net.forward()
+            boxes = []
+            for i in range(detections.shape[2]):
+                if detections[0, 0, i, 2] > 0.5:
+                    # The model emits normalized coords slightly outside
+                    # [0, 1] for faces at the frame edge; clamp so the
+                    # downstream crop never slices with negative indices
+                    x1 = max(0, int(detections[0, 0, i, 3] * w))
+                    y1 = max(0, int(detections[0, 0, i, 4] * h))
+                    x2 = min(w, int(detections[0, 0, i, 5] * w))
+                    y2 = min(h, int(detections[0, 0, i, 6] * h))
+                    if x2 <= x1 or y2 <= y1:
+                        continue
+                    boxes.append((x1, y1, x2 - x1, y2 - y1))
+            return boxes
+        return self.face_cascade.detectMultiScale(gray_small_frame, 1.1, 4)
+
     def generate_frames(self):
         """Generate video frames with face recognition"""
         try:
-            camera = self.get_camera()
+            worker = self.get_camera_worker()
             self.is_camera_active = True
-            
+            frame_count = 0
+            last_seq = 0
+            face_locations = []
+
             while self.is_camera_active:
-                success, frame = camera.read()
-                if not success:
-                    break
-                
-                # Resize frame for faster processing
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = small_frame[:, :, ::-1]
-                
-                # ✅ Always use local Haar Cascade
-                face_cascade = cv2.CascadeClassifier("data/haarcascade_frontalface_default.xml")
-                gray_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray_small_frame, 1.1, 4)
-                face_locations = [(y, x+w, y+h, x) for (x, y, w, h) in faces]
-                
+                # Block until the worker has decoded a genuinely new frame -
+                # re-encoding the same slot would burn a core on duplicate
+                # JPEGs and skew the DETECT_EVERY cadence
+                frame, last_seq = worker.read_new(last_seq)
+                if frame is None:
+                    if not worker.is_alive():
+                        break
+                    continue
+
+                frame_count += 1
+
+                # Detection only runs on key frames; in between, the previous
+                # boxes are carried forward and the tracks keep their names,
+                # skipping the resize/cvtColor/detect work entirely
+                if frame_count % self.DETECT_EVERY == 1:
+                    # Resize frame for faster processing; UMat input routes the
+                    # resize/cvtColor/detect pipeline through OpenCL when available
+                    source = cv2.UMat(frame) if self.use_opencl else frame
+                    # INTER_AREA integrates over pixel blocks when shrinking -
+                    # less aliasing than the INTER_LINEAR default, at no cost
+                    small_frame = cv2.resize(source, (0, 0), fx=0.25, fy=0.25,
+                                             interpolation=cv2.INTER_AREA)
+                    gray_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+                    faces = self.detect_faces(small_frame, gray_small_frame)
+
+                    # Rescale all boxes from quarter-res back to full-res in one
+                    # vectorized pass instead of per-box Python arithmetic
+                    if len(faces) > 0:
+                        boxes = np.asarray(faces, dtype=np.int32) * 4
+                        xs, ys, ws, hs = boxes.T
+                        face_locations = list(zip(ys, xs + ws, ys + hs, xs))
+                    else:
+                        face_locations = []
+
+                # Drop tracks that haven't been seen recently
+                now = time.time()
+                self._tracks = [t for t in self._tracks
+                                if now - t['t_seen'] < self.TRACK_PRUNE]
+
                 # Process each face found
                 for (top, right, bottom, left) in face_locations:
-                    # Scale back up
-                    top *= 4
-                    right *= 4
-                    bottom *= 4
-                    left *= 4
-                    
-                    face_region = frame[top:bottom, left:right]
-                    name = self.face_utils.recognize_face(face_region)
-                    
+                    box = (top, right, bottom, left)
+
+                    # Same face as a fresh track? Reuse its name - recognition
+                    # on a stationary face is redundant frame over frame
+                    track = None
+                    for candidate in self._tracks:
+                        if (now - candidate['t_seen'] < self.TRACK_TTL and
+                                self._iou(box, candidate['box']) > self.TRACK_IOU):
+                            track = candidate
+                            track['box'] = box
+                            track['t_seen'] = now
+                            break
+
+                    if track is None:
+                        # New face: hand recognition to the pool and draw
+                        # "Unknown" until the result lands. copy() because the
+                        # crop is a view into this frame's buffer
+                        face_region = frame[top:bottom, left:right]
+                        track = {'box': box, 'name': 'Unknown', 't_seen': now,
+                                 't_submitted': now,
+                                 'future': self._recognize_pool.submit(
+                                     self.face_utils.recognize_face, face_region.copy())}
+                        self._tracks.append(track)
+
+                    # Pick up a finished recognition result for this track
+                    future = track.get('future')
+                    if future is not None and future.done():
+                        try:
+                            track['name'] = future.result()
+                        except Exception as e:
+                            print(f"Recognition error: {e}")
+                        track.pop('future', None)
+                    elif (future is None and track['name'] == 'Unknown' and
+                            now - track['t_submitted'] > self.UNKNOWN_RETRY):
+                        # Still unrecognized: try again with the current crop
+                        # instead of caching the negative result forever
+                        face_region = frame[top:bottom, left:right]
+                        track['t_submitted'] = now
+                        track['future'] = self._recognize_pool.submit(
+                            self.face_utils.recognize_face, face_region.copy())
+
+                    name = track['name']
+
                     if name != "Unknown":
                         current_time = time.time()
                         if (name not in self.last_recognition_time or 
@@ -110,13 +382,16 @@ class AttendanceSystem:
                     cv2.putText(frame, name, (left + 6, bottom - 6), 
                                cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
                 
-                ret, buffer = cv2.imencode('.jpg', frame)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                
-                time.sleep(0.1)
-                
+                # Quality 75 halves output bytes vs the default with no visible
+                # loss on a webcam stream
+                if self.jpeg is not None:
+                    frame_bytes = self.jpeg.encode(frame, quality=75, jpeg_subsample=TJSAMP_420)
+                else:
+                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
+                    frame_bytes = buffer.tobytes()
+                # join() over + concatenation: one allocation for the part
+                yield b''.join((_FRAME_HEADER, frame_bytes, b'\r\n'))
+
         except Exception as e:
             print(f"Camera error: {e}")
         finally:
@@ -128,10 +403,9 @@ attendance_system = AttendanceSystem()
 @app.route('/')
 def index():
     today_attendance = attendance_system.attendance_manager.get_today_attendance()
-    enrolled_students = attendance_system.face_utils.get_enrolled_students()
-    return render_template('index.html', 
-                         attendance=today_attendance, 
-                         enrolled_count=len(enrolled_students))
+    return render_template('index.html',
+                         attendance=today_attendance,
+                         enrolled_count=attendance_system.face_utils.get_enrolled_count())
 
 @app.route('/enroll')
 def enroll_page():
@@ -145,37 +419,40 @@ def enroll_student():
         if not student_name:
             return jsonify({'success': False, 'message': 'Student name is required'})
         
-        if student_name in attendance_system.face_utils.known_face_names:
+        if student_name in attendance_system.face_utils.name_to_index:
             return jsonify({'success': False, 'message': 'Student already enrolled'})
         
-        camera = attendance_system.get_camera()
-        success, frame = camera.read()
-        
-        if not success:
+        # If the capture thread owns the camera, take its newest frame instead
+        # of competing with it for read() calls
+        worker = attendance_system.camera_worker
+        if worker is not None and worker.is_alive():
+            frame = worker.read()
+        else:
+            camera = attendance_system.get_camera()
+            success, frame = camera.read()
+            if not success:
+                frame = None
+
+        if frame is None:
             return jsonify({'success': False, 'message': 'Could not capture image from camera'})
         
         gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        # ✅ Force load Haar Cascade with absolute path
-        cascade_path = os.path.join(os.getcwd(), "data", "haarcascade_frontalface_default.xml")
-        if not os.path.exists(cascade_path):
-            cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
-
-        print("Loading Haar Cascade from:", cascade_path)
-        face_cascade = cv2.CascadeClassifier(cascade_path)
+        # Detect on a half-resolution copy (1/4 the pixels for the cascade)
+        # and rescale the boxes; the enrollment crop still comes from the
+        # full-resolution frame
+        small_gray = cv2.resize(gray_frame, None, fx=0.5, fy=0.5,
+                                interpolation=cv2.INTER_AREA)
+        faces = attendance_system.face_cascade.detectMultiScale(
+            small_gray, scaleFactor=1.2, minNeighbors=4, minSize=(30, 30))
 
-        if face_cascade.empty():
-            return jsonify({'success': False, 'message': f'Failed to load Haar cascade from {cascade_path}'})
-
-        faces = face_cascade.detectMultiScale(gray_frame, 1.1, 4)
-        
         if len(faces) == 0:
             return jsonify({'success': False, 'message': 'No face detected in image'})
-        
+
         if len(faces) > 1:
             return jsonify({'success': False, 'message': 'Multiple faces detected. Please ensure only one person is in frame'})
-        
-        x, y, w, h = faces[0]
+
+        x, y, w, h = faces[0] * 2
         face_region = frame[y:y+h, x:x+w]
         
         student_image_path = f'student_images/{student_name}.jpg'
@@ -231,9 +508,31 @@ def delete_student(student_name):
 def favicon():
     return app.send_static_file('favicon.ico')
 
+def print_simd_support():
+    """Report whether the installed OpenCV wheel dispatches AVX2/AVX-512 kernels.
+
+    Stock pip wheels are usually SSE4.2-only; detection, cvtColor and resize
+    all run ~2x faster on a wheel built with AVX2 dispatch (see replit.md
+    for the build flags).
+    """
+    build_info = cv2.getBuildInformation()
+    dispatched = ''
+    for line in build_info.splitlines():
+        if 'Dispatched code generation' in line:
+            dispatched = line.split(':', 1)[-1].strip()
+            break
+    if 'AVX2' in dispatched:
+        print(f"✅ OpenCV dispatches wide SIMD kernels: {dispatched}")
+    else:
+        print(f"⚠️ OpenCV built without AVX2 dispatch ({dispatched or 'unknown'}) - "
+              "see replit.md for building an AVX2-enabled wheel")
+
 if __name__ == '__main__':
     print("Starting Smart Attendance System...")
+    print_simd_support()
     print("Access the application at http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Dev entry point only - production runs behind gunicorn (see
+    # gunicorn_conf.py); debug mode adds per-request reloader overhead
+    app.run(host='0.0.0.0', port=5000, threaded=True)
 
 
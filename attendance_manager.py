@@ -3,21 +3,127 @@ Attendance Management System
 Handles attendance tracking, CSV file operations, and data management
 """
 
+import atexit
 import csv
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 import pandas as pd
+import xlsxwriter
+
+# Optional vectorized CSV reader for the bulk statistics/history paths;
+# falls back to the stdlib csv module when pyarrow is not installed
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+
+    _ARROW_COLUMNS = pacsv.ConvertOptions(
+        column_types={'Name': pa.string(), 'Date': pa.string(), 'Time': pa.string()})
+except ImportError:
+    pacsv = None
 
 class AttendanceManager:
     def __init__(self):
         """Initialize attendance manager"""
         self.attendance_dir = 'attendance_records'
         os.makedirs(self.attendance_dir, exist_ok=True)
+
+        # Today's filename/date string, recomputed only on date rollover -
+        # saves a datetime.now() + strftime + path join per recognition event
+        self._cached_day = None
+        self._cached_date_str = ''
+        self._cached_filename = ''
+
+        # In-memory set of names already marked today - avoids rescanning
+        # the day's CSV on every recognition event
+        self._today_lock = threading.Lock()
+        self._today_date = None
+        self._today_names = set()
+
+        # Background writer thread keeps today's CSV open and batches row
+        # appends, so mark_attendance never does file I/O on the caller
+        self._write_q = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+        atexit.register(self.close)
+
+    def _writer_loop(self):
+        """Consume queued attendance rows, keeping the day's file open between writes"""
+        out_file = None
+        writer = None
+        open_date = None
+
+        while True:
+            item = self._write_q.get()
+            if item is None:
+                break
+
+            name, date_str, time_str = item
+            try:
+                # Reopen on first write and on date rollover
+                if out_file is None or date_str != open_date:
+                    if out_file is not None:
+                        out_file.close()
+                    filename = os.path.join(self.attendance_dir, f'attendance_{date_str}.csv')
+                    file_exists = os.path.exists(filename)
+                    out_file = open(filename, 'a', newline='', encoding='utf-8')
+                    writer = csv.writer(out_file)
+                    open_date = date_str
+                    if not file_exists:
+                        writer.writerow(['Name', 'Date', 'Time'])
+
+                writer.writerow([name, date_str, time_str])
+
+                # Flush once the burst is drained instead of per row
+                if self._write_q.empty():
+                    out_file.flush()
+
+            except Exception as e:
+                print(f"Error writing attendance for {name}: {e}")
+
+        if out_file is not None:
+            out_file.close()
+
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        if self._writer_thread.is_alive():
+            self._write_q.put(None)
+            self._writer_thread.join(timeout=5)
+
+    def _ensure_today_loaded(self):
+        """Populate the in-memory set from today's CSV (once per day rollover).
+
+        Caller must hold self._today_lock.
+        """
+        filename = self.get_today_filename()
+        today = self._cached_date_str
+        if today == self._today_date:
+            return
+
+        self._today_date = today
+        self._today_names = set()
+
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                next(reader, None)  # Skip header row
+                for row in reader:
+                    if len(row) >= 1:
+                        self._today_names.add(row[0])
     
     def get_today_filename(self):
-        """Get today's attendance filename"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        return os.path.join(self.attendance_dir, f'attendance_{today}.csv')
+        """Get today's attendance filename (cached until the date rolls over)"""
+        now = time.localtime()
+        day = (now.tm_year, now.tm_yday)
+        if day != self._cached_day:
+            today = time.strftime('%Y-%m-%d', now)
+            self._cached_day = day
+            self._cached_date_str = today
+            self._cached_filename = os.path.join(self.attendance_dir, f'attendance_{today}.csv')
+        return self._cached_filename
     
     def mark_attendance(self, student_name):
         """
@@ -25,32 +131,25 @@ class AttendanceManager:
         Returns True if successfully marked, False if already marked today
         """
         try:
-            filename = self.get_today_filename()
             current_time = datetime.now()
             date_str = current_time.strftime('%Y-%m-%d')
             time_str = current_time.strftime('%H:%M:%S')
-            
-            # Check if student already marked present today
-            if self.is_already_marked_today(student_name):
-                print(f"{student_name} already marked present today")
-                return False
-            
-            # Create CSV file with headers if it doesn't exist
-            file_exists = os.path.exists(filename)
-            
-            with open(filename, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                
-                # Write headers if file is new
-                if not file_exists:
-                    writer.writerow(['Name', 'Date', 'Time'])
-                
-                # Write attendance record
-                writer.writerow([student_name, date_str, time_str])
-            
+
+            # Check-and-mark under one lock so concurrent recognitions of the
+            # same student cannot both enqueue a row
+            with self._today_lock:
+                self._ensure_today_loaded()
+                if student_name in self._today_names:
+                    print(f"{student_name} already marked present today")
+                    return False
+                self._today_names.add(student_name)
+
+            # Hand the row to the writer thread; no file I/O on this path
+            self._write_q.put((student_name, date_str, time_str))
+
             print(f"Attendance marked for {student_name} at {time_str}")
             return True
-            
+
         except Exception as e:
             print(f"Error marking attendance for {student_name}: {e}")
             return False
@@ -58,21 +157,10 @@ class AttendanceManager:
     def is_already_marked_today(self, student_name):
         """Check if student is already marked present today"""
         try:
-            filename = self.get_today_filename()
-            
-            if not os.path.exists(filename):
-                return False
-            
-            with open(filename, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                next(reader, None)  # Skip header row
-                
-                for row in reader:
-                    if len(row) >= 1 and row[0] == student_name:
-                        return True
-            
-            return False
-            
+            with self._today_lock:
+                self._ensure_today_loaded()
+                return student_name in self._today_names
+
         except Exception as e:
             print(f"Error checking attendance for {student_name}: {e}")
             return False
@@ -130,20 +218,34 @@ class AttendanceManager:
         try:
             history = []
             
-            # Get all attendance files
-            attendance_files = [f for f in os.listdir(self.attendance_dir) 
-                              if f.startswith('attendance_') and f.endswith('.csv')]
-            
+            # Get all attendance files; scandir avoids a stat per entry and
+            # hands back ready-made paths
+            attendance_files = [e for e in os.scandir(self.attendance_dir)
+                                if e.is_file() and e.name.startswith('attendance_')
+                                and e.name.endswith('.csv')]
+
             # Sort files by date (newest first)
-            attendance_files.sort(reverse=True)
-            
+            attendance_files.sort(key=lambda e: e.name, reverse=True)
+
             # Limit to specified number of days
             if days > 0:
                 attendance_files = attendance_files[:days]
-            
-            for filename in attendance_files:
-                filepath = os.path.join(self.attendance_dir, filename)
-                
+
+            for entry in attendance_files:
+                filepath = entry.path
+
+                if pacsv is not None:
+                    # Vectorized read + filter in native code
+                    table = pacsv.read_csv(filepath, convert_options=_ARROW_COLUMNS)
+                    matches = table.filter(pc.equal(table.column('Name'), student_name))
+                    for row in matches.to_pylist():
+                        history.append({
+                            'name': row['Name'],
+                            'date': row['Date'],
+                            'time': row['Time']
+                        })
+                    continue
+
                 with open(filepath, 'r', encoding='utf-8') as file:
                     reader = csv.DictReader(file)
                     for row in reader:
@@ -171,23 +273,32 @@ class AttendanceManager:
             }
             
             # Get all attendance files
-            attendance_files = [f for f in os.listdir(self.attendance_dir) 
-                              if f.startswith('attendance_') and f.endswith('.csv')]
-            
+            attendance_files = [e for e in os.scandir(self.attendance_dir)
+                                if e.is_file() and e.name.startswith('attendance_')
+                                and e.name.endswith('.csv')]
+
             stats['total_days'] = len(attendance_files)
-            
-            for filename in attendance_files:
-                filepath = os.path.join(self.attendance_dir, filename)
-                date = filename.replace('attendance_', '').replace('.csv', '')
+
+            for entry in attendance_files:
+                filepath = entry.path
+                date = entry.name.replace('attendance_', '').replace('.csv', '')
                 daily_count = 0
-                
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        stats['total_attendances'] += 1
-                        stats['unique_students'].add(row['Name'])
-                        daily_count += 1
-                
+
+                if pacsv is not None:
+                    # Columnar read: row count and unique names come from
+                    # native kernels instead of a per-row Python loop
+                    table = pacsv.read_csv(filepath, convert_options=_ARROW_COLUMNS)
+                    daily_count = table.num_rows
+                    stats['total_attendances'] += daily_count
+                    stats['unique_students'].update(pc.unique(table.column('Name')).to_pylist())
+                else:
+                    with open(filepath, 'r', encoding='utf-8') as file:
+                        reader = csv.DictReader(file)
+                        for row in reader:
+                            stats['total_attendances'] += 1
+                            stats['unique_students'].add(row['Name'])
+                            daily_count += 1
+
                 stats['daily_counts'][date] = daily_count
             
             stats['unique_students'] = len(stats['unique_students'])
@@ -206,43 +317,54 @@ class AttendanceManager:
     def export_attendance_to_excel(self, start_date=None, end_date=None):
         """Export attendance data to Excel file"""
         try:
-            # Get all attendance files
-            attendance_files = [f for f in os.listdir(self.attendance_dir) 
-                              if f.startswith('attendance_') and f.endswith('.csv')]
-            
-            all_records = []
-            
-            for filename in attendance_files:
-                filepath = os.path.join(self.attendance_dir, filename)
-                
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        all_records.append({
-                            'Name': row['Name'],
-                            'Date': row['Date'],
-                            'Time': row['Time']
-                        })
-            
-            if all_records:
-                df = pd.DataFrame(all_records)
-                
+            # Get all attendance files (sorted so rows stream out in date order)
+            attendance_files = sorted((e for e in os.scandir(self.attendance_dir)
+                                       if e.is_file() and e.name.startswith('attendance_')
+                                       and e.name.endswith('.csv')),
+                                      key=lambda e: e.name)
+
+            if start_date and end_date:
+                start_date = pd.to_datetime(start_date)
+                end_date = pd.to_datetime(end_date)
+
+            excel_filename = f'attendance_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+            # Stream rows straight to disk with xlsxwriter's constant-memory
+            # mode. Rows must be written strictly top-to-bottom in that mode
+            # (it flushes a row as soon as a later one is touched), which is
+            # why this drives the worksheet directly instead of going through
+            # df.to_excel - pandas emits cells column by column and
+            # constant_memory silently drops writes to already-flushed rows
+            workbook = xlsxwriter.Workbook(excel_filename, {'constant_memory': True})
+            worksheet = workbook.add_worksheet()
+            date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+            worksheet.write_row(0, 0, ['Name', 'Date', 'Time'])
+
+            total_rows = 0
+            for entry in attendance_files:
+                # C-parser CSV read, one day's file at a time
+                df = pd.read_csv(entry.path, parse_dates=['Date'])
+
                 # Filter by date range if provided
-                if start_date and end_date:
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    start_date = pd.to_datetime(start_date)
-                    end_date = pd.to_datetime(end_date)
+                if start_date is not None and end_date is not None:
                     df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
-                
-                # Export to Excel
-                excel_filename = f'attendance_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-                df.to_excel(excel_filename, index=False)
-                print(f"Attendance data exported to {excel_filename}")
-                return excel_filename
-            else:
+
+                for name, date, time_str in df.itertuples(index=False):
+                    total_rows += 1
+                    worksheet.write_string(total_rows, 0, str(name))
+                    worksheet.write_datetime(total_rows, 1, date, date_format)
+                    worksheet.write_string(total_rows, 2, str(time_str))
+
+            workbook.close()
+
+            if total_rows == 0:
+                os.remove(excel_filename)
                 print("No attendance data to export")
                 return None
-                
+
+            print(f"Attendance data exported to {excel_filename}")
+            return excel_filename
+
         except Exception as e:
             print(f"Error exporting attendance data: {e}")
             return None
@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration for production serving
+Start with: gunicorn -c gunicorn_conf.py app:app
+"""
+
+bind = "0.0.0.0:5000"
+
+# Single worker: the camera, face database and track state live in process
+# memory and cannot be shared across worker processes
+workers = 1
+
+# gevent keeps long-lived MJPEG streams from monopolizing a thread, so
+# /get_attendance and friends stay responsive while clients are streaming
+worker_class = "gevent"
+worker_connections = 100
+
+# MJPEG connections are intentionally long-lived; never time them out
+timeout = 0
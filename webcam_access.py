@@ -4,24 +4,70 @@ Provides functions to open and capture frames from webcam
 """
 
 import cv2
+import threading
 
 def get_camera(index_range=5):
     """
-    Try to open available cameras (0–4) with DirectShow backend.
+    Open a camera, probing index 0 across backends before sweeping 1..N.
     Returns an opened VideoCapture object or None if no camera works.
     """
     print("🔍 Scanning for available cameras...")
-    for index in range(index_range):
-        camera = cv2.VideoCapture(index, cv2.CAP_DSHOW)  # force DirectShow backend
+    # Failed opens can take seconds each; camera 0 usually exists, so try
+    # it with every backend before paying for the higher-index sweep
+    candidates = [(0, cv2.CAP_DSHOW), (0, cv2.CAP_MSMF), (0, cv2.CAP_ANY)]
+    candidates += [(index, cv2.CAP_DSHOW) for index in range(1, index_range)]
+    for index, backend in candidates:
+        camera = cv2.VideoCapture(index, backend)
         if camera.isOpened():
-            print(f"✅ Camera opened successfully at index {index} (DirectShow)")
+            print(f"✅ Camera opened successfully at index {index}")
+            # Request MJPG at an explicit resolution: the camera compresses
+            # on-device, so USB bandwidth no longer caps the frame rate the
+            # way driver-default uncompressed YUY2 does
+            camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            camera.set(cv2.CAP_PROP_FPS, 30)
+            camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # always read the freshest frame
             return camera
-        else:
-            print(f"❌ Camera index {index} not available")
+        print(f"❌ Camera index {index} not available")
         camera.release()
     return None
 
 
+class FrameGrabber(threading.Thread):
+    """
+    Capture thread that continuously reads frames into a single slot.
+    Consumers call get() for the newest frame instead of blocking on
+    camera.read(), so capture overlaps with processing.
+    """
+
+    def __init__(self, camera):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.latest_frame = None
+        self.lock = threading.Lock()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            ret, frame = self.camera.read()
+            if not ret:
+                break
+            with self.lock:
+                self.latest_frame = frame
+
+    def get(self):
+        """Return a copy of the newest frame, or None if nothing captured yet"""
+        with self.lock:
+            if self.latest_frame is None:
+                return None
+            return self.latest_frame.copy()
+
+    def stop(self):
+        """Stop the capture loop"""
+        self.running = False
+
+
 def capture_frame(camera):
     """
     Capture a single frame from an opened camera